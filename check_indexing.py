@@ -1,18 +1,31 @@
 import chromadb
 from chromadb.config import Settings
 
+from shards import list_shards
+from index_state import CHROMA_PATH, load_state
+
 client = chromadb.PersistentClient(
-    path="./chroma_db",
+    path=CHROMA_PATH,
     settings=Settings(
         anonymized_telemetry=False
     )
 )
-collection = client.get_collection("wiki_rag")
 
-docs = collection.get()
-print("Number of documents in collection:", len(docs["ids"]))
+state = load_state()
+print("Active index:", state["active"])
+if state["migration"]:
+    print("Migration in progress:", state["migration"])
+
+total = 0
+for name in list_shards(client):
+    collection = client.get_collection(name)
+    docs = collection.get()
+    print(f"Number of documents in {name} {collection.metadata or ''}:", len(docs["ids"]))
+    total += len(docs["ids"])
+
+    for i, doc in enumerate(docs["documents"]):
+        print(f"Document {i}:")
+        print(doc)
+        print("-"*20)
 
-for i, doc in enumerate(docs["documents"]):
-    print(f"Document {i}:")
-    print(doc)
-    print("-"*20)
+print("Number of documents in all shards:", total)
@@ -10,6 +10,7 @@ from .preprompt_editor import PrepromptEditor
 from .debug_log import debug_log
 
 from localLLM import ollama
+import profiling
 
 class Sidebar(Vertical):
     can_focus = True
@@ -159,7 +160,7 @@ class Sidebar(Vertical):
         self.blur()
 
         self.settings_container = Container(
-            Settings(['Change preprompt']),
+            Settings(['Change preprompt', 'Toggle RAG', 'Toggle memory', 'Toggle profiling']),
             id='settings-container'
         )
         self.mount(self.settings_container)
@@ -172,6 +173,33 @@ class Sidebar(Vertical):
             case 'Change preprompt':
                 self.clear_cursor()
                 self.open_preprompt_editor()
+            case 'Toggle RAG':
+                self.toggle_rag()
+            case 'Toggle memory':
+                self.toggle_memory()
+            case 'Toggle profiling':
+                self.toggle_profiling()
+
+    def toggle_rag(self):
+        use_rag = not self.app.app_state['use_rag']
+        self.app.app_state['use_rag'] = use_rag
+
+        if not use_rag:
+            self.app.prefetcher.cancel()
+
+        self.app.notify(f"RAG {'enabled' if use_rag else 'disabled'}")
+
+    def toggle_memory(self):
+        use_memory = not self.app.app_state['use_memory']
+        self.app.app_state['use_memory'] = use_memory
+
+        self.app.notify(f"Long-term memory {'enabled' if use_memory else 'disabled'}")
+
+    def toggle_profiling(self):
+        if profiling.toggle():
+            self.app.notify(f'Profiling enabled ({profiling.mode()})')
+        else:
+            self.app.notify(f'Profiling disabled, output in {profiling.PROFILE_DIR}/')
 
     def close_settings(self, input_mode):
         if hasattr(self, 'settings_container') and self.settings_container:
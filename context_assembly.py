@@ -0,0 +1,150 @@
+import math
+
+import numpy as np
+
+# ---------- CONFIG ----------
+TOKEN_BUDGET = 1200             # max prompt tokens spent on retrieved context
+MMR_LAMBDA = 0.7                # 1.0 = pure relevance, 0.0 = pure diversity
+DUPLICATE_THRESHOLD = 0.95      # cosine similarity above which chunks are copies
+TOKENS_PER_WORD = 1.3           # rough word -> token ratio for budgeting
+MIN_TRIM_TOKENS = 32            # don't bother keeping a sliver smaller than this
+
+# ---------- FUNCTIONS ----------
+def estimate_tokens(text):
+    """Cheap token estimate, good enough for budgeting. Rounds up so the
+    estimates of parts never add up to less than that of the whole."""
+    return math.ceil(len(text.split()) * TOKENS_PER_WORD)
+
+def split_chunk_id(doc_id):
+    """Split a `{path}_{idx}` chunk id into (path, idx)"""
+    source, _, idx = doc_id.rpartition("_")
+    if not source or not idx.isdigit():
+        return doc_id, None
+    return source, int(idx)
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=float)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def mmr_select(query_vec, doc_vecs, k, lambda_mult=MMR_LAMBDA,
+               duplicate_threshold=DUPLICATE_THRESHOLD):
+    """Pick up to k indices by maximal marginal relevance, dropping near copies"""
+    if len(doc_vecs) == 0:
+        return []
+
+    doc_vecs = _normalize(doc_vecs)
+    query_sim = doc_vecs @ _normalize(query_vec)
+    doc_sim = doc_vecs @ doc_vecs.T
+
+    selected = []
+    candidates = list(range(len(doc_vecs)))
+    while candidates and len(selected) < k:
+        if selected:
+            redundancy = doc_sim[np.ix_(candidates, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(candidates))
+
+        scores = lambda_mult * query_sim[candidates] - (1 - lambda_mult) * redundancy
+        best = int(np.argmax(scores))
+        index = candidates.pop(best)
+
+        if selected and redundancy[best] >= duplicate_threshold:
+            continue
+        selected.append(index)
+
+    return selected
+
+def source_label(metadata):
+    """Short citation for a chunk, empty for chunks indexed without metadata"""
+    if not metadata or not metadata.get("title"):
+        return ""
+    if metadata.get("section"):
+        return f"[{metadata['title']} § {metadata['section']}]"
+    return f"[{metadata['title']}]"
+
+def trim_to_budget(chunks, token_budget=TOKEN_BUDGET):
+    """Keep chunks in order until the budget is spent, cutting the last one
+    short. Source labels are paid for out of the same budget."""
+    kept = []
+    remaining = token_budget
+    for chunk in chunks:
+        label = source_label(chunk.get("metadata"))
+        cost = estimate_tokens(f"{label} {chunk['text']}")
+        if cost <= remaining:
+            kept.append(chunk)
+            remaining -= cost
+            continue
+
+        if remaining >= MIN_TRIM_TOKENS:
+            room = int(remaining / TOKENS_PER_WORD) - len(label.split())
+            kept.append({**chunk, "text": " ".join(chunk["text"].split()[:room])})
+        break
+
+    return kept
+
+def merge_adjacent(chunks):
+    """Join runs of consecutive pieces of the same source, in page order.
+    Runs keep the rank of their best chunk."""
+    ranked = []
+    for rank, chunk in enumerate(chunks):
+        source, idx = split_chunk_id(chunk["id"])
+        ranked.append((source, idx, rank, chunk))
+    ranked.sort(key=lambda item: (item[0], -1 if item[1] is None else item[1], item[2]))
+
+    runs = []
+    for source, idx, rank, chunk in ranked:
+        last = runs[-1] if runs else None
+        if (last is not None and idx is not None and last["source"] == source
+                and last["idx"] is not None and idx == last["idx"] + 1):
+            last["chunk"]["text"] = f"{last['chunk']['text']} {chunk['text']}"
+            last["idx"] = idx
+            last["rank"] = min(last["rank"], rank)
+        else:
+            runs.append({"source": source, "idx": idx, "rank": rank, "chunk": {**chunk}})
+
+    runs.sort(key=lambda run: run["rank"])
+    return [run["chunk"] for run in runs]
+
+def assemble_context(query_vec, ids, documents, embeddings, k=5,
+                     token_budget=TOKEN_BUDGET, metadatas=None):
+    """Turn raw query hits into a compact context string plus token stats"""
+    metadatas = metadatas or [None] * len(documents)
+    raw_tokens = sum(estimate_tokens(doc) for doc in documents[:k])
+
+    seen = set()
+    unique = []
+    for i, doc in enumerate(documents):
+        key = " ".join(doc.split()).lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(i)
+
+    picked = mmr_select(query_vec, [embeddings[i] for i in unique], k)
+    chunks = [
+        {"id": ids[unique[i]], "text": documents[unique[i]], "metadata": metadatas[unique[i]]}
+        for i in picked
+    ]
+    # merge before trimming so a cut-short chunk is never joined to the next one
+    chunks = trim_to_budget(merge_adjacent(chunks), token_budget)
+
+    context = "\n".join(
+        "\n".join(filter(None, [source_label(chunk["metadata"]), chunk["text"]]))
+        for chunk in chunks
+    )
+    final_tokens = estimate_tokens(context)
+
+    stats = {
+        "raw_tokens": raw_tokens,
+        "final_tokens": final_tokens,
+        "saved_tokens": max(raw_tokens - final_tokens, 0),
+        "chunks_in": len(documents),
+        "chunks_out": len(chunks),
+        "sources": [
+            (chunk["metadata"] or {}).get("source", split_chunk_id(chunk["id"])[0])
+            for chunk in chunks
+        ],
+    }
+    return context, stats
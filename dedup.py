@@ -0,0 +1,104 @@
+import threading
+import zlib
+
+import numpy as np
+
+# ---------- CONFIG ----------
+SHINGLE_SIZE = 5                # words per shingle
+NUM_PERM = 128                  # MinHash signature length
+BANDS = 16                      # LSH bands, NUM_PERM / BANDS rows each
+THRESHOLD = 0.8                 # estimated Jaccard at which a chunk counts as a copy
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(1)
+_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+
+# ---------- FUNCTIONS ----------
+def shingles(text, size=SHINGLE_SIZE):
+    words = text.lower().split()
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i+size]) for i in range(len(words) - size + 1)}
+
+def minhash(text):
+    """MinHash signature of the word shingles of text"""
+    hashes = np.fromiter(
+        (zlib.crc32(s.encode("utf-8")) for s in shingles(text)),
+        dtype=np.uint64,
+    )
+    # (a * x + b) mod p for every permutation and shingle, then min per permutation
+    values = (np.outer(_A, hashes) + _B[:, None]) % _PRIME
+    return values.min(axis=1).astype(np.uint32)
+
+class NearDuplicateIndex:
+    """LSH index over MinHash signatures, safe to share between ingest workers"""
+
+    def __init__(self, threshold=THRESHOLD, bands=BANDS):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = NUM_PERM // bands
+
+        self.lock = threading.Lock()
+        self.buckets = [{} for _ in range(bands)]
+        self.signatures = {}
+
+        self.seen = 0
+        self.removed = 0
+        self.removed_words = 0
+        self.total_words = 0
+
+    def _band_keys(self, signature):
+        return [
+            signature[i * self.rows:(i + 1) * self.rows].tobytes()
+            for i in range(self.bands)
+        ]
+
+    def check_and_add(self, doc_id, text):
+        """Return the id of an earlier near-copy of text, or None after indexing it"""
+        signature = minhash(text)
+        keys = self._band_keys(signature)
+        words = len(text.split())
+
+        with self.lock:
+            self.seen += 1
+            self.total_words += words
+
+            candidates = set()
+            for band, key in zip(self.buckets, keys):
+                candidates.update(band.get(key, ()))
+
+            for candidate in candidates:
+                similarity = np.mean(self.signatures[candidate] == signature)
+                if similarity >= self.threshold:
+                    self.removed += 1
+                    self.removed_words += words
+                    return candidate
+
+            self.signatures[doc_id] = signature
+            for band, key in zip(self.buckets, keys):
+                band.setdefault(key, []).append(doc_id)
+            return None
+
+    def discard(self, doc_ids):
+        """Forget chunks that never made it into the index, so later copies
+        of them are stored instead of skipped"""
+        with self.lock:
+            for doc_id in doc_ids:
+                signature = self.signatures.pop(doc_id, None)
+                if signature is None:
+                    continue
+                for band, key in zip(self.buckets, self._band_keys(signature)):
+                    if doc_id in band.get(key, ()):
+                        band[key].remove(doc_id)
+                        if not band[key]:
+                            del band[key]
+
+    def report(self):
+        if not self.seen:
+            return "No chunks checked for duplicates"
+        return (
+            f"Removed {self.removed}/{self.seen} chunks as near-duplicates "
+            f"({100 * self.removed / self.seen:.1f}% of chunks, "
+            f"{100 * self.removed_words / max(self.total_words, 1):.1f}% of words)"
+        )
@@ -0,0 +1,157 @@
+import bz2
+import gzip
+import os
+import posixpath
+import re
+import tarfile
+import zipfile
+import xml.etree.ElementTree as ET
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+WIKI_COMMENT = re.compile(r"<!--.*?-->", re.DOTALL)
+WIKI_REF = re.compile(r"<ref[^>/]*/>|<ref[^>]*>.*?</ref>", re.DOTALL | re.IGNORECASE)
+WIKI_TEMPLATE = re.compile(r"\{\{[^{}]*\}\}")
+WIKI_TABLE = re.compile(r"\{\|(?:(?!\{\|).)*?\|\}", re.DOTALL)
+WIKI_LINK = re.compile(r"\[\[([^\[\]]*)\]\]")
+WIKI_EXTERNAL_LINK = re.compile(r"\[https?://[^\s\]]+(?:\s+([^\]]*))?\]")
+WIKI_EMPHASIS = re.compile(r"'{2,}")
+WIKI_MAGIC_WORD = re.compile(r"__[A-Z]+__")
+WIKI_DROPPED_LINKS = ("file:", "image:", "category:")
+
+# ---------- FUNCTIONS ----------
+def should_skip(name):
+    """Same rules as the loose-file walk: no _ or . prefixed files, no .js"""
+    base = posixpath.basename(name.replace(os.sep, "/"))
+    return not base or base.startswith("_") or base.startswith(".") or base.endswith(".js")
+
+def decode(data):
+    return data.decode("utf-8", errors="ignore")
+
+def iter_directory(folder, skip=0):
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for file in sorted(files):
+            path = os.path.join(root, file)
+            if not os.path.isfile(path) or should_skip(file):
+                continue
+            if skip:
+                skip -= 1
+                continue
+            with open(path, "rb") as f:
+                yield path, decode(f.read())
+
+def iter_tar(fileobj, archive, skip=0):
+    # "r|" streams members in order without seeking or an index
+    with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+        for member in tar:
+            if not member.isfile() or should_skip(member.name):
+                continue
+            if skip:
+                skip -= 1
+                continue
+            f = tar.extractfile(member)
+            if f is None:
+                continue
+            yield f"{archive}/{member.name}", decode(f.read())
+
+def iter_zip(archive, skip=0):
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            if info.is_dir() or should_skip(info.filename):
+                continue
+            if skip:
+                skip -= 1
+                continue
+            with zf.open(info) as f:
+                yield f"{archive}/{info.filename}", decode(f.read())
+
+def _replace_innermost(pattern, replace, text):
+    # nested markup is removed from the inside out until nothing matches
+    while True:
+        text, count = pattern.subn(replace, text)
+        if not count:
+            return text
+
+def _link_text(match):
+    parts = match.group(1).split("|")
+    if parts[0].strip().lower().startswith(WIKI_DROPPED_LINKS):
+        return ""
+    return parts[-1]
+
+def wikitext_to_text(text):
+    """Strip wikitext markup, keeping == heading == lines for section splitting"""
+    text = WIKI_COMMENT.sub("", text)
+    text = WIKI_REF.sub("", text)
+    text = _replace_innermost(WIKI_TEMPLATE, "", text)
+    text = _replace_innermost(WIKI_TABLE, "", text)
+    text = _replace_innermost(WIKI_LINK, _link_text, text)
+    text = WIKI_EXTERNAL_LINK.sub(lambda m: m.group(1) or "", text)
+    text = WIKI_EMPHASIS.sub("", text)
+    text = WIKI_MAGIC_WORD.sub("", text)
+    return text
+
+def iter_mediawiki_xml(fileobj, archive, skip=0):
+    """Yield (title, text) for every page of a MediaWiki XML export"""
+    context = ET.iterparse(fileobj, events=("start", "end"))
+    _, root = next(context)
+
+    for event, elem in context:
+        if event != "end" or elem.tag.rsplit("}", 1)[-1] != "page":
+            continue
+
+        title, text = "", ""
+        for child in elem.iter():
+            match child.tag.rsplit("}", 1)[-1]:
+                case "title":
+                    title = child.text or ""
+                case "text":
+                    text = child.text or ""
+
+        if title and text and not should_skip(title):
+            if skip:
+                skip -= 1
+            else:
+                yield f"{archive}/{title}", wikitext_to_text(text)
+
+        # drop finished pages so memory stays flat on multi-GB dumps
+        root.clear()
+
+def open_zstd(archive):
+    if zstandard is None:
+        raise RuntimeError(f"Reading {archive} needs the 'zstandard' package")
+    return zstandard.ZstdDecompressor().stream_reader(open(archive, "rb"))
+
+def iter_pages(source, skip=0):
+    """Yield (path, markup) for every page in a folder or a dump archive,
+    passing over the first skip pages without reading them"""
+    if os.path.isdir(source):
+        yield from iter_directory(source, skip)
+        return
+
+    name = source.lower()
+    if name.endswith((".tar.zst", ".tzst")):
+        with open_zstd(source) as f:
+            yield from iter_tar(f, source, skip)
+    elif name.endswith((".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz")):
+        with open(source, "rb") as f:
+            yield from iter_tar(f, source, skip)
+    elif name.endswith(".zip"):
+        yield from iter_zip(source, skip)
+    elif name.endswith(".xml.bz2"):
+        with bz2.open(source, "rb") as f:
+            yield from iter_mediawiki_xml(f, source, skip)
+    elif name.endswith(".xml.gz"):
+        with gzip.open(source, "rb") as f:
+            yield from iter_mediawiki_xml(f, source, skip)
+    elif name.endswith(".xml.zst"):
+        with open_zstd(source) as f:
+            yield from iter_mediawiki_xml(f, source, skip)
+    elif name.endswith(".xml"):
+        with open(source, "rb") as f:
+            yield from iter_mediawiki_xml(f, source, skip)
+    else:
+        raise ValueError(f"Don't know how to read dump {source}")
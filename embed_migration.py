@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Re-embed the index with another model while queries keep using the old one"""
+import argparse
+import time
+
+import chromadb
+from chromadb.config import Settings
+from ollama import Client
+
+from index_state import CHROMA_PATH, load_state, save_state, index_metadata
+from shards import list_shards, rename_shard, shard_version, shard_versions, SHARD_REFRESH_SECONDS
+
+# ---------- CONFIG ----------
+MIGRATION_BATCH = 32            # chunks re-embedded per Ollama call
+MIGRATION_DUTY_CYCLE = 0.5      # share of wall time spent embedding, rest left to chat
+
+# ---------- INIT ----------
+ollama = Client()
+client = chromadb.PersistentClient(
+    path=CHROMA_PATH,
+    settings=Settings(
+        anonymized_telemetry=False
+    )
+)
+
+# ---------- FUNCTIONS ----------
+def start_migration(state, embed_model):
+    """Reuse a matching unfinished migration or begin a new index version"""
+    migration = state["migration"]
+    if migration and migration["embed_model"] == embed_model:
+        print(f"Resuming migration to {embed_model} (v{migration['version']})")
+        return migration
+    if migration:
+        abort_migration(state)
+
+    versions = shard_versions(client).values()
+    version = max([state["active"]["version"], *versions]) + 1
+    state["migration"] = {
+        "version": version,
+        "embed_model": embed_model,
+        "dimension": None,
+        "progress": {},
+    }
+    save_state(state)
+    print(f"Migrating to {embed_model} as index v{version}")
+    return state["migration"]
+
+def migrate_shard(state, old_name, duty_cycle=MIGRATION_DUTY_CYCLE):
+    migration = state["migration"]
+    old = client.get_collection(old_name)
+    old_version = shard_version(old_name, old.metadata)
+    new_name = rename_shard(old_name, old_version, migration["version"])
+    offset = migration["progress"].get(old_name, 0)
+    total = old.count()
+
+    while offset < total:
+        batch = old.get(limit=MIGRATION_BATCH, offset=offset, include=["documents", "metadatas"])
+        if not batch["ids"]:
+            break
+
+        started = time.monotonic()
+        vectors = ollama.embed(model=migration["embed_model"], input=batch["documents"]).embeddings
+        if migration["dimension"] is None:
+            migration["dimension"] = len(vectors[0])
+
+        new = client.get_or_create_collection(new_name, metadata=index_metadata(migration))
+        metadatas = batch["metadatas"] if batch["metadatas"] and all(batch["metadatas"]) else None
+        new.upsert(
+            ids=batch["ids"],
+            documents=batch["documents"],
+            embeddings=vectors,
+            metadatas=metadatas,
+        )
+
+        offset += len(batch["ids"])
+        migration["progress"][old_name] = offset
+        save_state(state)
+        print(f"{new_name}: {offset}/{total}")
+
+        # sleep in proportion to the work done so interactive chat gets its turn
+        elapsed = time.monotonic() - started
+        time.sleep(elapsed * (1 - duty_cycle) / duty_cycle)
+
+def migrate(embed_model, drop_old=False):
+    """Re-embed every active shard into a new version, then switch over"""
+    state = load_state()
+    if state["active"]["embed_model"] == embed_model and not state["migration"]:
+        print(f"Index already uses {embed_model}")
+        return
+
+    old_version = state["active"]["version"]
+    migration = start_migration(state, embed_model)
+    for old_name in list_shards(client, old_version):
+        migrate_shard(state, old_name)
+
+    state["active"] = {
+        "version": migration["version"],
+        "embed_model": migration["embed_model"],
+        "dimension": migration["dimension"],
+    }
+    state["migration"] = None
+    save_state(state)
+    print(f"Switched queries to {embed_model} (v{migration['version']})")
+
+    if drop_old:
+        # running apps re-read the active index every SHARD_REFRESH_SECONDS
+        time.sleep(SHARD_REFRESH_SECONDS * 2)
+        for name in list_shards(client, old_version):
+            client.delete_collection(name)
+        print(f"Dropped index v{old_version}")
+
+def abort_migration(state):
+    migration = state["migration"]
+    if not migration:
+        return
+    for name in list_shards(client, migration["version"]):
+        client.delete_collection(name)
+    state["migration"] = None
+    save_state(state)
+    print(f"Aborted migration to {migration['embed_model']}")
+
+# ---------- RUN ----------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("embed_model", nargs="?")
+    parser.add_argument("--drop-old", action="store_true",
+                        help="delete the old index once queries have switched")
+    parser.add_argument("--abort", action="store_true",
+                        help="throw away an unfinished migration")
+    args = parser.parse_args()
+
+    if args.abort:
+        abort_migration(load_state())
+    elif args.embed_model:
+        migrate(args.embed_model, args.drop_old)
+    else:
+        parser.print_help()
@@ -1,46 +1,95 @@
 #!/usr/bin/env python3
 import os
+import re
+import json
+import time
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from bs4 import BeautifulSoup
 import chromadb
 from chromadb.config import Settings
 import numpy as np
 from ollama import Client
 
+from dump_reader import iter_pages
+from shards import shard_for, list_shards, relative_path, path_fields, can_route_to
+from dedup import NearDuplicateIndex
+from index_state import CHROMA_PATH, load_state, record_dimension, index_metadata
+from profiling import profiled
+
 # ---------- CONFIG ----------
-DUMP_DIR = "wiki_dump"          # folder with dumped HTML files
+DUMP_DIR = "wiki_dump"          # folder of HTML files, or a .tar.gz/.tar.zst/.zip/.xml.bz2 dump
+CHECKPOINT_FILE = ".ingest_checkpoint.json"
 CHUNK_SIZE = 200                # smaller chunks to avoid embed limits
-COLLECTION_NAME = "wiki_rag"
-EMBED_MODEL = "nomic-embed-text:latest"
 MAX_FILES=10000
+INGEST_WORKERS = 4              # pages embedded and written concurrently
+SKIP_NEAR_DUPLICATES = True     # drop chunks that are near-copies of earlier ones
+SECTION_MARKER = "\x00section:"
+WIKI_HEADING = re.compile(r"^(=+)\s*(.+?)\s*\1$")
 
 # ---------- INIT ----------
 ollama = Client()
 client = chromadb.PersistentClient(
-    path="./chroma_db",
+    path=CHROMA_PATH,
     settings=Settings(
         anonymized_telemetry=False
     )
 )
 
-try:
-    collection = client.get_collection(COLLECTION_NAME)
-    print('Collection get')
-except:
-    collection = client.create_collection(COLLECTION_NAME)
-    print('Collection created')
+shard_collections = {}
+shard_locks = {}
+shard_guard = threading.Lock()
+
+state = load_state()
+index = state["active"]
+
+duplicates = NearDuplicateIndex()
 
 # ---------- FUNCTIONS ----------
-def extract_text_from_html(file_path):
-    """Extract visible text from an HTML file"""
+def page_title(soup, path):
+    for tag in (soup.title, soup.h1):
+        if tag is not None and tag.get_text(strip=True):
+            return tag.get_text(" ", strip=True)
+    return os.path.splitext(os.path.basename(path))[0]
+
+def extract_text_from_html(path, markup):
+    """Extract the title and visible text of a page as (heading, text) sections"""
     try:
-        with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-            soup = BeautifulSoup(f, "html.parser")
-            text = soup.get_text(separator="\n")
-            text = "\n".join([line.strip() for line in text.splitlines() if line.strip()])
-            return text
+        soup = BeautifulSoup(markup, "html.parser")
+        title = page_title(soup, path)
+        # the title is kept as metadata, not as a section of its own
+        for tag in (soup.head, soup.title):
+            if tag is not None:
+                tag.decompose()
+        for heading in soup.find_all(["h1", "h2", "h3", "h4", "h5", "h6"]):
+            heading.replace_with(f"\n{SECTION_MARKER}{heading.get_text(' ', strip=True)}\n")
+        text = soup.get_text(separator="\n")
     except Exception as e:
-        print(f"Skipping {file_path}: {e}")
-        return ""
+        print(f"Skipping {path}: {e}")
+        return "", []
+
+    sections = []
+    heading, lines = "", []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+
+        # MediaWiki XML pages carry == Heading == lines instead of <h2> tags
+        wiki_heading = WIKI_HEADING.match(line)
+        if line.startswith(SECTION_MARKER) or wiki_heading:
+            if lines:
+                sections.append((heading, "\n".join(lines)))
+            heading = wiki_heading.group(2) if wiki_heading else line[len(SECTION_MARKER):]
+            lines = [heading] if heading else []
+            continue
+        lines.append(line)
+
+    if lines:
+        sections.append((heading, "\n".join(lines)))
+    return title, sections
 
 def chunk_text(text, chunk_size=CHUNK_SIZE):
     """Split text into smaller chunks"""
@@ -53,40 +102,214 @@ def chunk_text(text, chunk_size=CHUNK_SIZE):
     return chunks
 
 def embed_text(text):
-    """Embed text using Ollama"""
-    return np.array(ollama.embed(model=EMBED_MODEL, input=text).embeddings[0])
-
-def process_folder(folder, max_files=MAX_FILES):
-    """Walk folder and embed only the first max_files article files"""
-    processed_files = 0
-    for root, _, files in os.walk(folder):
-        for file in files:
+    """Embed text with the model the active index was built with"""
+    vector = np.array(ollama.embed(model=index["embed_model"], input=text).embeddings[0])
+    with shard_guard:
+        if index["dimension"] is None:
+            index.update(record_dimension(len(vector)))
+    if len(vector) != index["dimension"]:
+        raise ValueError(f"got {len(vector)}-dim vector, index uses {index['dimension']}")
+    return vector
+
+def load_checkpoint(source):
+    """Return how many pages of source were already ingested into the active index"""
+    try:
+        with open(CHECKPOINT_FILE, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return 0, 0
+    if (checkpoint.get("source") != os.path.abspath(source)
+            or checkpoint.get("version") != index["version"]
+            or not list_shards(client, index["version"])):
+        # written for another index, or the index was deleted since
+        return 0, 0
+    return checkpoint.get("position", 0), checkpoint.get("processed", 0)
+
+def save_checkpoint(source, position, processed, last_path):
+    tmp_path = f"{CHECKPOINT_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "source": os.path.abspath(source),
+            "version": index["version"],
+            "position": position,
+            "processed": processed,
+            "last": last_path,
+        }, f)
+    os.replace(tmp_path, CHECKPOINT_FILE)
+
+def clear_checkpoint():
+    try:
+        os.remove(CHECKPOINT_FILE)
+    except FileNotFoundError:
+        pass
+
+def get_shard(name):
+    """Shard collection plus the lock that serializes writes to it"""
+    with shard_guard:
+        if name not in shard_collections:
+            shard_collections[name] = client.get_or_create_collection(
+                name, metadata=index_metadata(index)
+            )
+            shard_locks[name] = threading.Lock()
+        return shard_collections[name], shard_locks[name]
+
+@profiled("ingest_page")
+def ingest_page(source, path, markup, target=None):
+    """Embed one page into its shard (or target), returns the chunk count or
+    None if nothing was stored"""
+    title, sections = extract_text_from_html(path, markup)
+    if not sections:
+        return None
+
+    page_metadata = {
+        "source": path,
+        "title": title,
+        "ingested_at": int(time.time()),
+        **path_fields(relative_path(path, source)),
+    }
+    chunks = [
+        (section, chunk)
+        for section, section_text in sections
+        for chunk in chunk_text(section_text)
+    ]
+
+    ids, documents, embeddings, metadatas = [], [], [], []
+    for idx, (section, chunk) in enumerate(chunks):
+        doc_id = f"{path}_{idx}"
+        if SKIP_NEAR_DUPLICATES and duplicates.check_and_add(doc_id, chunk):
+            continue
+        try:
+            embeddings.append(embed_text(chunk).tolist())
+        except Exception as e:
+            print(f"Embedding failed for chunk {doc_id}: {e}")
+            duplicates.discard([doc_id])
+            continue
+        ids.append(doc_id)
+        documents.append(chunk)
+        metadatas.append({**page_metadata, "section": section, "chunk": idx})
+
+    if ids:
+        name = target or shard_for(path, source, index["version"])
+        collection, lock = get_shard(name)
+        try:
+            with lock:
+                # upsert so pages redone after a resume don't trip on existing ids
+                collection.upsert(
+                    documents=documents,
+                    ids=ids,
+                    embeddings=embeddings,
+                    metadatas=metadatas,
+                )
+        except Exception as e:
+            print(f"Writing {path} to {name} failed: {e}")
+            duplicates.discard(ids)
+            return None
+    return len(chunks)
+
+@profiled("process_folder")
+def process_folder(source, max_files=MAX_FILES, only_shard=None, target=None):
+    """Stream pages from a folder or dump archive and embed the first max_files"""
+    checkpointing = only_shard is None
+    resume_at, processed_files = load_checkpoint(source) if checkpointing else (0, 0)
+    if resume_at:
+        print(f"Resuming {source} after {resume_at} pages")
+
+    pending = deque()
+
+    def finish_oldest():
+        # pages finish in submission order so the checkpoint never skips one
+        nonlocal processed_files
+        position, path, future = pending.popleft()
+        chunk_count = future.result()
+        if chunk_count is not None:
+            print(f"Processed {os.path.basename(path)}, {chunk_count} chunks.")
+            processed_files += 1
+        if checkpointing:
+            save_checkpoint(source, position, processed_files, path)
+
+    with ThreadPoolExecutor(max_workers=INGEST_WORKERS) as pool:
+        pages = iter_pages(source, skip=resume_at)
+        for position, (path, markup) in enumerate(pages, start=resume_at + 1):
+            while pending and (len(pending) >= INGEST_WORKERS * 2
+                               or processed_files + len(pending) >= max_files):
+                finish_oldest()
             if processed_files >= max_files:
-                return
-            path = os.path.join(root, file)
-            if not os.path.isfile(path):
-                continue
-            if file.startswith("_") or file.endswith(".js") or file.startswith("."):
-                continue
-            text = extract_text_from_html(path)
-            if not text:
+                break
+
+            if only_shard and shard_for(path, source, index["version"]) != only_shard:
+                # other shards' pages still use up the window a full ingest covers
+                if extract_text_from_html(path, markup)[1]:
+                    processed_files += 1
                 continue
-            chunks = chunk_text(text)
-            for idx, chunk in enumerate(chunks):
-                try:
-                    vector = embed_text(chunk)
-                    doc_id = f"{path}_{idx}"
-                    collection.add(
-                        documents=[chunk],
-                        ids=[doc_id],
-                        embeddings=[vector.tolist()]
-                    )
-                except Exception as e:
-                    print(f"Embedding failed for chunk {doc_id}: {e}")
-            print(f"Processed {file}, {len(chunks)} chunks.")
-            processed_files += 1
+
+            future = pool.submit(ingest_page, source, path, markup, target)
+            pending.append((position, path, future))
+
+        while pending:
+            finish_oldest()
+
+    # a completed run starts from the top next time instead of resuming past the end
+    if checkpointing:
+        clear_checkpoint()
+
+def rebuild_shard(source, name, max_files=MAX_FILES):
+    """Re-ingest the pages that route to one shard into a scratch collection,
+    then swap it in place of the old shard"""
+    if not can_route_to(name, index["version"]):
+        raise SystemExit(f"{name} is not a shard pages can be routed to")
+
+    # outside the wiki_rag_ prefix so running apps don't query it half-built
+    scratch = f"rebuild_{name}"[:63]
+    try:
+        client.delete_collection(scratch)
+    except Exception:
+        pass
+
+    process_folder(source, max_files, only_shard=name, target=scratch)
+    rebuilt, _ = get_shard(scratch)
+    if rebuilt.count() == 0:
+        client.delete_collection(scratch)
+        raise SystemExit(f"No pages in {source} route to {name}, left it untouched")
+
+    try:
+        client.delete_collection(name)
+    except Exception:
+        pass
+    rebuilt.modify(name=name)
+    with shard_guard:
+        for key in (name, scratch):
+            shard_collections.pop(key, None)
+            shard_locks.pop(key, None)
 
 # ---------- RUN ----------
-process_folder(DUMP_DIR)
-print(f"Finished embedding first {MAX_FILES} files into Chroma!")
+parser = argparse.ArgumentParser(description="Embed a wiki dump into Chroma")
+parser.add_argument("source", nargs="?", default=DUMP_DIR)
+parser.add_argument("--restart", action="store_true",
+                    help="ignore the checkpoint and ingest from the first page")
+parser.add_argument("--rebuild-shard", metavar="NAME",
+                    help="rebuild a single shard from the same first pages a full "
+                         "ingest covers; near-duplicates are only checked within "
+                         "the shard, so chunks skipped as copies of another "
+                         "shard's come back. One of: " + (', '.join(
+                        n for n in list_shards(client, index['version'])
+                        if can_route_to(n, index['version'])
+                    ) or 'none yet'))
+args = parser.parse_args()
+
+if state["migration"]:
+    print(f"Migration to {state['migration']['embed_model']} in progress, "
+          "wait for it to finish before ingesting")
+    raise SystemExit(1)
+
+if args.restart:
+    clear_checkpoint()
+
+if args.rebuild_shard:
+    rebuild_shard(args.source, args.rebuild_shard)
+    print(f"Rebuilt shard {args.rebuild_shard}!")
+else:
+    process_folder(args.source)
+    print(f"Finished embedding first {MAX_FILES} files into Chroma!")
 
+if SKIP_NEAR_DUPLICATES:
+    print(duplicates.report())
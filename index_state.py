@@ -0,0 +1,45 @@
+import json
+import os
+
+# ---------- CONFIG ----------
+CHROMA_PATH = "./chroma_db"
+STATE_FILE = os.path.join(CHROMA_PATH, "index_state.json")
+EMBED_MODEL = "nomic-embed-text:latest"   # used until an index records its own
+
+# ---------- FUNCTIONS ----------
+def default_state():
+    return {
+        "active": {"version": 0, "embed_model": EMBED_MODEL, "dimension": None},
+        "migration": None,
+    }
+
+def load_state():
+    """Which index version queries use, and any migration in progress"""
+    try:
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default_state()
+
+def save_state(state):
+    # write-then-rename so readers only ever see the old or the new state
+    os.makedirs(CHROMA_PATH, exist_ok=True)
+    tmp_path = f"{STATE_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, STATE_FILE)
+
+def record_dimension(dimension):
+    """Remember the active index's vector size the first time it is known"""
+    state = load_state()
+    if state["active"]["dimension"] is None:
+        state["active"]["dimension"] = dimension
+        save_state(state)
+    return state["active"]
+
+def index_metadata(index):
+    """Collection metadata describing how an index version was embedded"""
+    metadata = {"embed_model": index["embed_model"], "version": index["version"]}
+    if index.get("dimension"):
+        metadata["dimension"] = index["dimension"]
+    return metadata
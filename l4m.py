@@ -1,4 +1,5 @@
 import threading
+from datetime import datetime
 from enum import Enum, auto
 
 from textual import events
@@ -8,7 +9,10 @@ from textual.widgets import Static, Input, Markdown, Label, TextArea, Button
 from textual.containers import VerticalScroll, Horizontal, Container, Vertical
 from textual.binding import Binding
 
-from localLLM import ollama, load_preprompt
+from localLLM import ollama, client, embed_text, load_preprompt, retrieve_context, build_rag_prompt
+from memory import ConversationMemory, format_memories
+from prefetch import RetrievalPrefetcher
+from profiling import profiled, span
 
 from components.debug_log import debug_log
 from components.input_mode import InputMode
@@ -22,9 +26,17 @@ class ChatUI(App):
 
         self.app_state = {
             'model_name': 'gemma3:4b',
+            'use_rag': False,
+            'use_memory': True,
             'conversation': []
         }
 
+        self.prefetcher = RetrievalPrefetcher(retrieve_context)
+
+        self.session_id = datetime.now().strftime('tui_%Y-%m-%d_%H%M%S')
+        self.turn_count = 0
+        self.memory = ConversationMemory(client, embed_text)
+
         load_preprompt(self.app_state)
 
         self.messages = [
@@ -68,6 +80,14 @@ class ChatUI(App):
 
     def on_mount(self):
         self.query_one('#input-box').focus()
+
+    def on_text_area_changed(self, event: TextArea.Changed) -> None:
+        if event.text_area is not self.user_textarea:
+            return
+        if not self.app_state['use_rag']:
+            return
+
+        self.prefetcher.schedule(self.user_textarea.text)
     
     def on_key(self, event) -> None:
         match event.key:
@@ -113,6 +133,12 @@ class ChatUI(App):
         if not user_text:
             return
 
+        use_rag = self.app_state["use_rag"]
+        use_memory = self.app_state["use_memory"]
+        turn = self.turn_count
+        self.turn_count += 1
+        prefetched = self.prefetcher.claim(user_text) if use_rag else None
+
         self.user_textarea.text = ""
         self.user_textarea.focus()
 
@@ -124,11 +150,6 @@ class ChatUI(App):
         self.messages.append(user_message)
         self.render_messages(user_message)
 
-        self.app_state["conversation"].append({
-            "role": "user",
-            "content": user_text,
-        })
-
         assistant_message = {
             "role": "assistant",
             "text": "",
@@ -151,10 +172,46 @@ class ChatUI(App):
         spinner_timer = self.set_interval(0.1, spinner_tick)
 
         def stream_response():
+            with span("stream_response"):
+                generate_response()
+
+        def generate_response():
             nonlocal spinner_running
+
+            content = user_text
+            if use_rag:
+                context = prefetched.wait() if prefetched else None
+                if context is None:
+                    try:
+                        context = retrieve_context(user_text)
+                    except Exception as e:
+                        # answer without context rather than leave the spinner going
+                        debug_log(f"Retrieval failed: {e}")
+                        self.call_from_thread(
+                            self.notify,
+                            f"Retrieval failed, answering without context: {e}",
+                            severity="warning",
+                        )
+                if context is not None:
+                    content = build_rag_prompt(context, user_text)
+
+            self.app_state["conversation"].append({
+                "role": "user",
+                "content": content,
+            })
+
+            # recalled turns ride along for this request only, so they are
+            # never replayed as part of the stored conversation
+            messages = self.app_state["conversation"]
+            memories = self.memory.recall(user_text, self.session_id) if use_memory else []
+            if memories:
+                messages = messages[:-1] + [
+                    {"role": "system", "content": format_memories(memories)},
+                ] + messages[-1:]
+
             stream = ollama.chat(
                 model=self.app_state["model_name"],
-                messages=self.app_state["conversation"],
+                messages=messages,
                 stream=True,
             )
 
@@ -183,6 +240,9 @@ class ChatUI(App):
                 "content": full_response,
             })
 
+            if use_memory:
+                self.memory.remember(self.session_id, turn, user_text, full_response)
+
         threading.Thread(target=stream_response, daemon=True).start()
         self.update_mode(InputMode.TYPING)
     
@@ -216,6 +276,7 @@ class ChatUI(App):
         else:
             self.user_textarea.placeholder = "Press Enter to send, t to edit"
 
+    @profiled("render_messages")
     def render_messages(self, message):
         if message['role'] == "user":
             widget = Static(message['text'])
@@ -13,27 +13,86 @@ import re
 import os
 import time
 import threading
+from functools import lru_cache
+
+from context_assembly import assemble_context
+from shards import get_shards, query_shards, get_from_shards, filter_shards, build_where
+from index_state import CHROMA_PATH, EMBED_MODEL
+from profiling import profiled
+from components.debug_log import debug_log
+
+FETCH_MULTIPLIER = 4            # candidates fetched per context slot for MMR
+EMBED_CACHE_SIZE = 1024         # query embeddings kept in memory
 
 logging.getLogger("chromadb.telemetry.product.posthog").setLevel(logging.CRITICAL)
 
 ollama = Client()
 
-client = chromadb.Client(settings=Settings(anonymized_telemetry=False))
-try:
-    collection = client.get_collection("wiki_rag")
-except:
-    collection = client.create_collection("wiki_rag")
+client = chromadb.PersistentClient(
+    path=CHROMA_PATH,
+    settings=Settings(
+        anonymized_telemetry=False
+    )
+)
+
+@lru_cache(maxsize=EMBED_CACHE_SIZE)
+def _embed_cached(model: str, text: str):
+    e = ollama.embed(model=model, input=text)
+    return tuple(e.embeddings[0])
+
+def embed_text(text: str, model: str = EMBED_MODEL):
+    return np.array(_embed_cached(model, text))
+
+def retrieve_context(query: str, k=5, path_prefix=None, title=None, since=None, until=None):
+    context, _ = retrieve_context_with_stats(query, k, path_prefix, title, since, until)
+    return context
+
+@profiled("retrieve_context")
+def retrieve_context_with_stats(query: str, k=5, path_prefix=None, title=None,
+                                since=None, until=None):
+    index, shards = get_shards(client)
+    shards = filter_shards(shards, path_prefix)
+    query_vec = embed_text(query, index["embed_model"])
+    if index["dimension"] and len(query_vec) != index["dimension"]:
+        raise ValueError(
+            f'{index["embed_model"]} returned {len(query_vec)}-dim vectors '
+            f'but the index was built with {index["dimension"]}'
+        )
+
+    results = query_shards(
+        shards,
+        query_vec.tolist(),
+        n_results=k * FETCH_MULTIPLIER,
+        include=["documents", "embeddings", "metadatas"],
+        where=build_where(path_prefix, title, since, until),
+    )
+
+    context, stats = assemble_context(
+        query_vec,
+        results["ids"][0],
+        results["documents"][0],
+        results["embeddings"][0],
+        k=k,
+        metadatas=results["metadatas"][0],
+    )
+    debug_log(
+        f"Context: {stats['final_tokens']} tokens from {stats['chunks_out']}/"
+        f"{stats['chunks_in']} chunks, saved {stats['saved_tokens']} tokens, "
+        f"sources: {', '.join(stats['sources'])}"
+    )
 
-def embed_text(text: str):
-    e = ollama.embed(model="nomic-embed-text:latest", input=text)
-    return np.array(e.embeddings[0])
+    return context, stats
 
-def retrieve_context(query: str, k=5):
-    query_vec = embed_text(query)
-    results = collection.query(query_embeddings=[query_vec.tolist()], n_results=k)
-    docs = results["documents"][0]
+def fetch_adjacent(source: str, chunk: int, radius=1):
+    _, shards = get_shards(client)
+    ids = [f"{source}_{i}" for i in range(max(chunk - radius, 0), chunk + radius + 1)]
+    results = get_from_shards(shards, ids, include=["documents", "metadatas"])
 
-    return "\n".join(docs)
+    chunks = [
+        {"id": doc_id, "text": doc, "metadata": metadata}
+        for doc_id, doc, metadata in zip(results["ids"], results["documents"], results["metadatas"])
+    ]
+    return sorted(chunks, key=lambda c: ids.index(c["id"]))
 
 def ask(prompt: str, model_name: str):
     cli_state['conversation'].append({'role': 'user', 'content': prompt})
@@ -59,9 +118,12 @@ def ask(prompt: str, model_name: str):
     })
 
 
+def build_rag_prompt(context: str, prompt: str):
+    return f"Context:\n{context}\n\nQuestion: {prompt}"
+
 def ask_rag(prompt: str, model_name: str):
     context = retrieve_context(prompt)
-    contexted_prompt = f"Context:\n{context}\n\nQuestion: {prompt}"
+    contexted_prompt = build_rag_prompt(context, prompt)
 
     ask(contexted_prompt, model_name)
 
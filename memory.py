@@ -0,0 +1,220 @@
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from index_state import load_state
+
+# ---------- CONFIG ----------
+MEMORY_COLLECTION = "chat_memory"
+HISTORY_DIR = "chat_history"
+RECALL_K = 3                    # past turns added to a prompt at most
+RECALL_MAX_DISTANCE = 0.5       # cosine distance above which a memory is ignored
+MAX_TURN_WORDS = 300            # longer turns are cut before embedding
+MAX_AGE_DAYS = 90               # unused memories older than this are dropped
+KEEP_IF_RECALLED = 3            # ...unless they were recalled at least this often
+MAX_MEMORIES = 5000
+PRUNE_EVERY = 50                # turns remembered between prune passes
+REEMBED_BATCH = 64              # memories re-embedded per write after a model change
+
+logger = logging.getLogger(__name__)
+
+# ---------- FUNCTIONS ----------
+def strip_rag_context(content):
+    """Drop the retrieved context a RAG prompt was wrapped in"""
+    if content.startswith("Context:\n") and "\n\nQuestion: " in content:
+        return content.rsplit("\n\nQuestion: ", 1)[1]
+    return content
+
+def turn_text(user_text, assistant_text):
+    words = f"User: {user_text}\nAssistant: {assistant_text}".split(" ")
+    return " ".join(words[:MAX_TURN_WORDS])
+
+def iter_turns(conversation):
+    """Yield (user, assistant) pairs from a conversation message list"""
+    for prev, message in zip(conversation, conversation[1:]):
+        if prev.get("role") == "user" and message.get("role") == "assistant":
+            yield strip_rag_context(prev.get("content", "")), message.get("content", "")
+
+def format_memories(memories):
+    lines = ["Relevant excerpts from earlier conversations with this user:"]
+    lines += [f"---\n{memory}" for memory in memories]
+    return "\n".join(lines)
+
+class ConversationMemory:
+    """Embeds finished chat turns on a background thread and recalls the
+    closest ones for new messages"""
+
+    def __init__(self, client, embed, embed_model=None):
+        self.client = client
+        self.embed = embed
+        # follow the model the active index was embedded with
+        self.embed_model = embed_model or load_state()["active"]["embed_model"]
+        self.collection = self.client.get_or_create_collection(
+            MEMORY_COLLECTION, metadata=self._metadata()
+        )
+        stored_model = (self.collection.metadata or {}).get("embed_model")
+        self.ready = stored_model == self.embed_model
+
+        self.queue = queue.Queue()
+        self.since_prune = 0
+        self.worker = threading.Thread(target=self._work, daemon=True)
+        self.worker.start()
+
+        if not self.ready:
+            self.queue.put(("reembed", None))
+        self.queue.put(("backfill", None))
+
+    def _metadata(self):
+        return {"embed_model": self.embed_model, "hnsw:space": "cosine"}
+
+    def remember(self, session, turn, user_text, assistant_text):
+        """Queue a finished turn for embedding; never blocks"""
+        if user_text.strip() and assistant_text.strip():
+            self.queue.put(("remember", (session, turn, user_text, assistant_text)))
+
+    def recall(self, query, session=None, k=RECALL_K):
+        """Past turns most relevant to query, excluding the current session"""
+        if not self.ready:
+            return []
+        try:
+            if self.collection.count() == 0:
+                return []
+            results = self.collection.query(
+                query_embeddings=[self.embed(query, self.embed_model).tolist()],
+                n_results=min(k, self.collection.count()),
+                where={"session": {"$ne": session}} if session else None,
+                include=["documents", "distances"],
+            )
+        except Exception as e:
+            logger.warning("Memory recall failed: %s", e)
+            return []
+
+        hits = [
+            (doc_id, doc)
+            for doc_id, doc, distance in zip(
+                results["ids"][0], results["documents"][0], results["distances"][0]
+            )
+            if distance <= RECALL_MAX_DISTANCE
+        ]
+        if hits:
+            self.queue.put(("touch", [doc_id for doc_id, _ in hits]))
+        return [doc for _, doc in hits]
+
+    def _work(self):
+        while True:
+            task, payload = self.queue.get()
+            try:
+                # never mix vectors of two models; retried until it succeeds
+                if not self.ready and task in ("remember", "backfill"):
+                    self._reembed()
+                match task:
+                    case "remember":
+                        self._store(*payload)
+                    case "touch":
+                        self._touch(payload)
+                    case "reembed":
+                        self._reembed()
+                    case "backfill":
+                        self._backfill()
+                        self._prune()
+            except Exception as e:
+                logger.warning("Memory %s failed: %s", task, e)
+
+    def _store(self, session, turn, user_text, assistant_text, created_at=None):
+        text = turn_text(user_text, assistant_text)
+        now = int(time.time())
+        self.collection.upsert(
+            ids=[f"{session}_{turn}"],
+            documents=[text],
+            embeddings=[self.embed(text, self.embed_model).tolist()],
+            metadatas=[{
+                "session": session,
+                "created_at": created_at or now,
+                "last_used_at": created_at or now,
+                "recalls": 0,
+            }],
+        )
+
+        self.since_prune += 1
+        if self.since_prune >= PRUNE_EVERY:
+            self._prune()
+
+    def _reembed(self):
+        """Embed the stored memories again after the embed model changed.
+        Builds a new collection and swaps it in, so a crash keeps the old one."""
+        scratch = f"{MEMORY_COLLECTION}_reembed"
+        try:
+            self.client.delete_collection(scratch)
+        except Exception:
+            pass
+        rebuilt = self.client.create_collection(scratch, metadata=self._metadata())
+
+        found = self.collection.get(include=["documents", "metadatas"])
+        for start in range(0, len(found["ids"]), REEMBED_BATCH):
+            documents = found["documents"][start:start + REEMBED_BATCH]
+            rebuilt.upsert(
+                ids=found["ids"][start:start + REEMBED_BATCH],
+                documents=documents,
+                embeddings=[self.embed(doc, self.embed_model).tolist() for doc in documents],
+                metadatas=found["metadatas"][start:start + REEMBED_BATCH],
+            )
+
+        self.client.delete_collection(MEMORY_COLLECTION)
+        rebuilt.modify(name=MEMORY_COLLECTION)
+        self.collection = rebuilt
+        self.ready = True
+
+    def _touch(self, ids):
+        found = self.collection.get(ids=ids, include=["metadatas"])
+        now = int(time.time())
+        self.collection.update(
+            ids=found["ids"],
+            metadatas=[
+                {**metadata, "last_used_at": now, "recalls": metadata.get("recalls", 0) + 1}
+                for metadata in found["metadatas"]
+            ],
+        )
+
+    def _backfill(self):
+        """Embed turns from saved chats that aren't in the memory yet"""
+        for path in sorted(glob.glob(os.path.join(HISTORY_DIR, "*.json"))):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    conversation = json.load(f).get("conversation", [])
+            except (OSError, ValueError, AttributeError):
+                continue
+
+            session = os.path.splitext(os.path.basename(path))[0]
+            turns = list(iter_turns(conversation))
+            ids = [f"{session}_{turn}" for turn in range(len(turns))]
+            if not ids:
+                continue
+            existing = set(self.collection.get(ids=ids, include=[])["ids"])
+
+            created_at = int(os.path.getmtime(path))
+            for turn, (user_text, assistant_text) in enumerate(turns):
+                if ids[turn] not in existing:
+                    self._store(session, turn, user_text, assistant_text, created_at)
+
+    def _prune(self):
+        """Drop stale memories that were rarely recalled, then cap the total"""
+        self.since_prune = 0
+        cutoff = int(time.time()) - MAX_AGE_DAYS * 86400
+        self.collection.delete(where={"$and": [
+            {"last_used_at": {"$lt": cutoff}},
+            {"recalls": {"$lt": KEEP_IF_RECALLED}},
+        ]})
+
+        overflow = self.collection.count() - MAX_MEMORIES
+        if overflow <= 0:
+            return
+        found = self.collection.get(include=["metadatas"])
+        ranked = sorted(
+            zip(found["ids"], found["metadatas"]),
+            key=lambda item: (item[1].get("recalls", 0), item[1].get("last_used_at", 0)),
+        )
+        self.collection.delete(ids=[doc_id for doc_id, _ in ranked[:overflow]])
@@ -0,0 +1,93 @@
+import threading
+
+# ---------- CONFIG ----------
+PREFETCH_DELAY = 0.6            # seconds of no typing before retrieval starts
+MIN_PREFETCH_CHARS = 12         # drafts shorter than this aren't worth embedding
+
+class _Prefetch:
+    def __init__(self, text: str):
+        self.text = text
+        self.context = None
+        self.failed = False
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        """Block until retrieval finishes, None if it failed or timed out"""
+        if not self.done.wait(timeout) or self.failed:
+            return None
+        return self.context
+
+class RetrievalPrefetcher:
+    """Runs retrieval for the draft in the background whenever typing pauses"""
+
+    def __init__(self, retrieve, delay=PREFETCH_DELAY, min_chars=MIN_PREFETCH_CHARS):
+        self.retrieve = retrieve
+        self.delay = delay
+        self.min_chars = min_chars
+
+        self.lock = threading.Lock()
+        self.timer = None
+        self.pending = None
+        self.current = None
+
+    def schedule(self, draft: str):
+        """Call on every edit; restarts the debounce and drops stale results"""
+        text = draft.strip()
+
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+            if self.current is not None and self.current.text == text:
+                self.pending = None
+                return
+
+            self.current = None
+            self.pending = None
+            if len(text) < self.min_chars:
+                return
+
+            self.pending = text
+            self.timer = threading.Timer(self.delay, self._run, args=(text,))
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _run(self, text: str):
+        with self.lock:
+            if self.pending != text:
+                return
+            self.pending = None
+            self.timer = None
+            entry = _Prefetch(text)
+            self.current = entry
+
+        try:
+            entry.context = self.retrieve(text)
+        except Exception:
+            entry.failed = True
+        entry.done.set()
+
+    def claim(self, draft: str):
+        """Take the prefetch for exactly this text, or None if there isn't one"""
+        text = draft.strip()
+
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self.pending = None
+
+            entry, self.current = self.current, None
+
+        if entry is None or entry.text != text:
+            return None
+        return entry
+
+    def cancel(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = None
+            self.pending = None
+            self.current = None
@@ -0,0 +1,194 @@
+import atexit
+import cProfile
+import functools
+import itertools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+# ---------- CONFIG ----------
+PROFILE_ENV = "L4M_PROFILE"     # "spans", "sampling" or "cprofile" (1 means spans)
+PROFILE_DIR = "profile"
+SAMPLE_INTERVAL = 0.005         # seconds between stack samples
+MODES = ("spans", "sampling", "cprofile")
+
+# all hooks check this first, so a disabled profiler costs one global lookup
+_mode = None
+_lock = threading.Lock()
+_spans = []
+_active_threads = Counter()
+_folded = Counter()
+_profiles = []
+_profiler = None
+_sampler = None
+_dump_count = itertools.count(1)
+
+# ---------- FUNCTIONS ----------
+def is_enabled():
+    return _mode is not None
+
+def mode():
+    return _mode
+
+def enable(new_mode="spans"):
+    global _mode, _sampler, _profiler
+    if new_mode not in MODES:
+        raise ValueError(f"Unknown profiling mode {new_mode!r}, use one of {MODES}")
+
+    with _lock:
+        if _mode is not None:
+            return
+        _mode = new_mode
+        if _mode == "sampling":
+            stop = threading.Event()
+            thread = threading.Thread(target=_sample_loop, args=(stop,), daemon=True)
+            _sampler = (thread, stop)
+            thread.start()
+        elif _mode == "cprofile":
+            # one profiler for the whole process; 3.12 refuses a second active one
+            _profiler = cProfile.Profile()
+            _profiler.enable()
+
+def disable():
+    """Stop profiling and write out everything collected so far"""
+    global _mode, _sampler, _profiler
+    with _lock:
+        if _mode is None:
+            return None
+        _mode = None
+        if _sampler is not None:
+            thread, stop = _sampler
+            stop.set()
+            thread.join()
+            _sampler = None
+        if _profiler is not None:
+            _profiler.disable()
+            _profiles.append(_profiler)
+            _profiler = None
+    return dump()
+
+def toggle(new_mode=None):
+    if is_enabled():
+        disable()
+        return False
+    enable(new_mode or _env_mode() or "spans")
+    return True
+
+@contextmanager
+def span(stage):
+    """Time a block as one stage; a no-op while profiling is off"""
+    if _mode is None:
+        yield
+        return
+
+    thread_id = threading.get_ident()
+    start = time.perf_counter()
+    try:
+        _active_threads[thread_id] += 1
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        _spans.append((stage, start, duration, thread_id))
+        _active_threads[thread_id] -= 1
+
+def profiled(stage):
+    """Decorator form of span()"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _mode is None:
+                return fn(*args, **kwargs)
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _sample_loop(stop):
+    # only threads currently inside a profiled stage are sampled
+    while not stop.wait(SAMPLE_INTERVAL):
+        frames = sys._current_frames()
+        for thread_id, count in list(_active_threads.items()):
+            frame = frames.get(thread_id)
+            if count <= 0 or frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            _folded[";".join(reversed(stack))] += 1
+
+def dump():
+    """Write spans as a Chrome trace plus a per-stage summary, and samples as
+    folded stacks or cProfile stats, depending on what was collected"""
+    if not _spans and not _folded and not _profiles:
+        return None
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = f"{time.strftime('%Y-%m-%d_%H%M%S')}_{os.getpid()}_{next(_dump_count)}"
+    written = []
+
+    spans, _spans[:] = list(_spans), []
+    if spans:
+        origin = min(start for _, start, _, _ in spans)
+        trace_path = os.path.join(PROFILE_DIR, f"trace_{stamp}.json")
+        with open(trace_path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": [
+                {
+                    "name": stage, "ph": "X", "pid": os.getpid(), "tid": thread_id,
+                    "ts": (start - origin) * 1e6, "dur": duration * 1e6,
+                }
+                for stage, start, duration, thread_id in spans
+            ]}, f)
+        written.append(trace_path)
+
+        by_stage = defaultdict(list)
+        for stage, _, duration, _ in spans:
+            by_stage[stage].append(duration)
+        summary_path = os.path.join(PROFILE_DIR, f"summary_{stamp}.txt")
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write(f"{'stage':<20}{'calls':>8}{'total s':>12}{'mean ms':>12}{'max ms':>12}\n")
+            for stage, durations in sorted(by_stage.items()):
+                f.write(
+                    f"{stage:<20}{len(durations):>8}{sum(durations):>12.3f}"
+                    f"{1000 * sum(durations) / len(durations):>12.2f}"
+                    f"{1000 * max(durations):>12.2f}\n"
+                )
+        written.append(summary_path)
+
+    if _folded:
+        folded_path = os.path.join(PROFILE_DIR, f"samples_{stamp}.folded")
+        with open(folded_path, "w", encoding="utf-8") as f:
+            for stack, count in _folded.most_common():
+                f.write(f"{stack} {count}\n")
+        _folded.clear()
+        written.append(folded_path)
+
+    profiles, _profiles[:] = list(_profiles), []
+    if profiles:
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        prof_path = os.path.join(PROFILE_DIR, f"cprofile_{stamp}.prof")
+        stats.dump_stats(prof_path)
+        written.append(prof_path)
+
+    return written
+
+def _env_mode():
+    value = os.environ.get(PROFILE_ENV, "").strip().lower()
+    if value in ("", "0", "false", "off"):
+        return None
+    return "spans" if value in ("1", "true", "on") else value
+
+if _env_mode():
+    enable(_env_mode())
+atexit.register(disable)
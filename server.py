@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""Headless OpenAI-compatible chat server sharing one Ollama client and index"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from localLLM import ollama, retrieve_context, build_rag_prompt, fetch_adjacent
+from shards import build_where
+
+# ---------- CONFIG ----------
+HOST = "127.0.0.1"
+PORT = 8000
+DEFAULT_MODEL = "gemma3:4b"
+MAX_CONCURRENT = 4              # generations and retrievals running at once
+MAX_CONNECTIONS = 32            # open connections, each holding at most one body
+MAX_BODY_BYTES = 1_000_000      # reject requests bigger than this
+MAX_MESSAGES = 200              # history length accepted per request
+SOCKET_TIMEOUT = 60             # seconds a client may stall a read or write
+MAX_K = 20                      # chunks a single retrieval may ask for
+MAX_RADIUS = 5                  # neighbours fetched each side of a chunk
+
+work_slots = threading.BoundedSemaphore(MAX_CONCURRENT)
+
+# ---------- FUNCTIONS ----------
+def validate_messages(body):
+    """Check the request messages and return them as plain role/content dicts"""
+    messages = body.get("messages")
+    if not isinstance(messages, list) or not messages:
+        raise ValueError("'messages' must be a non-empty list")
+    if len(messages) > MAX_MESSAGES:
+        raise ValueError(f"at most {MAX_MESSAGES} messages are accepted")
+
+    for m in messages:
+        if (not isinstance(m, dict) or not isinstance(m.get("role"), str)
+                or not isinstance(m.get("content") or "", str)):
+            raise ValueError("each message needs a string 'role' and 'content'")
+
+    return [{"role": m["role"], "content": m.get("content") or ""} for m in messages]
+
+def add_rag_context(messages, filters):
+    """Wrap the last user turn in retrieved context"""
+    for message in reversed(messages):
+        if message["role"] == "user":
+            context = retrieve_context(message["content"], **filters)
+            message["content"] = build_rag_prompt(context, message["content"])
+            break
+
+def int_param(body, key, default, low, high):
+    """Read an integer field, clamped to [low, high]"""
+    value = body.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"'{key}' must be an integer")
+    return max(low, min(value, high))
+
+def retrieval_filters(body):
+    """Pick and check the retrieve_context filters in a request body"""
+    filters = {}
+    for key in ("path_prefix", "title"):
+        if body.get(key) is not None:
+            if not isinstance(body[key], str):
+                raise ValueError(f"'{key}' must be a string")
+            filters[key] = body[key]
+    for key in ("since", "until"):
+        if body.get(key) is not None:
+            if isinstance(body[key], bool) or not isinstance(body[key], (int, float)):
+                raise ValueError(f"'{key}' must be a unix timestamp")
+            filters[key] = int(body[key])
+    build_where(**filters)
+    return filters
+
+def completion_chunk(completion_id, model, delta, finish_reason=None):
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+def completion(completion_id, model, content):
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+    }
+
+class BoundedHTTPServer(ThreadingHTTPServer):
+    """Threading server that turns connections away instead of growing without limit"""
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connection_slots = threading.BoundedSemaphore(MAX_CONNECTIONS)
+
+    def process_request(self, request, client_address):
+        if not self.connection_slots.acquire(blocking=False):
+            try:
+                request.sendall(b"HTTP/1.0 503 Service Unavailable\r\nContent-Length: 0\r\n\r\n")
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        super().process_request(request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.connection_slots.release()
+
+class ChatHandler(BaseHTTPRequestHandler):
+    server_version = "l4m"
+    timeout = SOCKET_TIMEOUT
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, status, message):
+        self.send_json(status, {"error": {"message": message}})
+
+    def send_event(self, payload):
+        data = payload if isinstance(payload, str) else json.dumps(payload)
+        self.wfile.write(f"data: {data}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length < 0:
+            raise ValueError("bad Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise ValueError("request body too large")
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(body, dict):
+            raise ValueError("request body must be a JSON object")
+        return body
+
+    def acquire_slot(self):
+        """Take a work slot or answer 503 straight away"""
+        if work_slots.acquire(blocking=False):
+            return True
+        self.send_error_json(503, "Server busy, try again shortly")
+        return False
+
+    def do_GET(self):
+        match self.path:
+            case "/v1/models":
+                try:
+                    models = [m.model for m in ollama.list().get("models", [])]
+                except Exception as e:
+                    self.send_error_json(502, f"Ollama request failed: {e}")
+                    return
+                self.send_json(200, {
+                    "object": "list",
+                    "data": [{"id": m, "object": "model"} for m in models],
+                })
+            case "/health":
+                self.send_json(200, {"status": "ok"})
+            case _:
+                self.send_error_json(404, f"Unknown path {self.path}")
+
+    def do_POST(self):
+        try:
+            body = self.read_json()
+        except ValueError as e:
+            self.send_error_json(400, str(e))
+            return
+
+        match self.path:
+            case "/v1/chat/completions":
+                handler = self.chat
+            case "/v1/retrieve":
+                handler = self.retrieve
+            case "/v1/adjacent":
+                handler = self.adjacent
+            case _:
+                self.send_error_json(404, f"Unknown path {self.path}")
+                return
+
+        if not self.acquire_slot():
+            return
+        try:
+            handler(body)
+        finally:
+            work_slots.release()
+
+    def retrieve(self, body):
+        query = body.get("query")
+        if not isinstance(query, str) or not query.strip():
+            self.send_error_json(400, "'query' is required")
+            return
+
+        try:
+            k = int_param(body, "k", 5, 1, MAX_K)
+            filters = retrieval_filters(body)
+        except ValueError as e:
+            self.send_error_json(400, str(e))
+            return
+
+        try:
+            context = retrieve_context(query, k=k, **filters)
+        except Exception as e:
+            self.send_error_json(502, f"Retrieval failed: {e}")
+            return
+        self.send_json(200, {"context": context})
+
+    def adjacent(self, body):
+        if not isinstance(body.get("source"), str) or not isinstance(body.get("chunk"), int):
+            self.send_error_json(400, "'source' and integer 'chunk' are required")
+            return
+        try:
+            radius = int_param(body, "radius", 1, 0, MAX_RADIUS)
+        except ValueError as e:
+            self.send_error_json(400, str(e))
+            return
+
+        try:
+            chunks = fetch_adjacent(body["source"], body["chunk"], radius)
+        except Exception as e:
+            self.send_error_json(502, f"Index lookup failed: {e}")
+            return
+        self.send_json(200, {"chunks": chunks})
+
+    def chat(self, body):
+        model = body.get("model") or DEFAULT_MODEL
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        try:
+            messages = validate_messages(body)
+            rag = body.get("rag")
+            filters = retrieval_filters(rag if isinstance(rag, dict) else {})
+        except ValueError as e:
+            self.send_error_json(400, str(e))
+            return
+
+        if body.get("rag"):
+            try:
+                add_rag_context(messages, filters)
+            except Exception as e:
+                self.send_error_json(502, f"Retrieval failed: {e}")
+                return
+
+        if not body.get("stream"):
+            try:
+                response = ollama.chat(model=model, messages=messages)
+            except Exception as e:
+                self.send_error_json(502, f"Ollama request failed: {e}")
+                return
+            content = response["message"].get("content", "")
+            self.send_json(200, completion(completion_id, model, content))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        try:
+            self.send_event(completion_chunk(completion_id, model, {"role": "assistant"}))
+            for chunk in ollama.chat(model=model, messages=messages, stream=True):
+                text = chunk["message"].get("content", "")
+                if text:
+                    self.send_event(completion_chunk(completion_id, model, {"content": text}))
+            self.send_event(completion_chunk(completion_id, model, {}, "stop"))
+            self.send_event("[DONE]")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            # headers are already out, so report the failure inside the stream
+            try:
+                self.send_event({"error": {"message": f"Ollama request failed: {e}"}})
+                self.send_event("[DONE]")
+            except OSError:
+                pass
+
+# ---------- RUN ----------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+
+    httpd = BoundedHTTPServer((args.host, args.port), ChatHandler)
+    print(f"Serving on http://{args.host}:{args.port}/v1")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\nBye bye!")
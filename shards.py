@@ -0,0 +1,193 @@
+import os
+import re
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from index_state import load_state
+from components.debug_log import debug_log
+
+# ---------- CONFIG ----------
+COLLECTION_NAME = "wiki_rag"
+SHARD_BY = "hash"               # "hash" or "subtree" (top-level folder of the dump)
+NUM_SHARDS = 4                  # only used when sharding by hash
+QUERY_WORKERS = 8               # shards queried at once
+PATH_DEPTH = 6                  # folder levels stored per chunk for prefix filters
+SHARD_REFRESH_SECONDS = 30      # how often to look for newly created shards
+
+_query_pool = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="shard-query")
+_shard_cache = {"at": 0.0, "index": None, "collections": []}
+
+# ---------- FUNCTIONS ----------
+def _prefix(version):
+    # version 0 is the index built before versioning and keeps its old names;
+    # suffixes never start with "_", so "__v" can't clash with a subtree shard
+    return COLLECTION_NAME if version == 0 else f"{COLLECTION_NAME}__v{version}"
+
+def _collection_name(suffix, version=0):
+    suffix = re.sub(r"[^a-zA-Z0-9_-]", "_", suffix).strip("_-") or "root"
+    return f"{_prefix(version)}_{suffix}"[:63]
+
+def relative_path(path, source):
+    """Page path inside the dump, with forward slashes"""
+    relative = os.path.relpath(path, source) if path.startswith(source) else path
+    return relative.replace(os.sep, "/")
+
+def path_fields(relative):
+    """path_0..path_N metadata so a folder prefix becomes an exact-match filter"""
+    folders = relative.split("/")[:-1][:PATH_DEPTH]
+    return {f"path_{i}": folder for i, folder in enumerate(folders)}
+
+def build_where(path_prefix=None, title=None, since=None, until=None):
+    """Chroma where clause for the retrieval filters, None when unfiltered"""
+    conditions = []
+    if path_prefix:
+        folders = [f for f in path_prefix.replace(os.sep, "/").split("/") if f]
+        if len(folders) > PATH_DEPTH:
+            # deeper folders aren't stored, so the filter would silently widen
+            raise ValueError(f"path_prefix can be at most {PATH_DEPTH} folders deep")
+        conditions += [{f"path_{i}": f} for i, f in enumerate(folders)]
+    if title:
+        conditions.append({"title": title})
+    if since is not None:
+        conditions.append({"ingested_at": {"$gte": int(since)}})
+    if until is not None:
+        conditions.append({"ingested_at": {"$lte": int(until)}})
+
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+def shard_for(path, source, version=0, shard_by=SHARD_BY, num_shards=NUM_SHARDS):
+    """Name of the shard collection a page belongs to"""
+    relative = relative_path(path, source)
+
+    if shard_by == "subtree":
+        head, _, rest = relative.partition("/")
+        return _collection_name(head if rest else "root", version)
+
+    return _collection_name(f"s{zlib.crc32(relative.encode('utf-8')) % num_shards}", version)
+
+def can_route_to(name, version=0, shard_by=SHARD_BY, num_shards=NUM_SHARDS):
+    """Whether shard_for can ever send a page to the collection called name"""
+    if shard_by == "subtree":
+        return name.startswith(f"{_prefix(version)}_") \
+            and not (version == 0 and name.startswith(f"{COLLECTION_NAME}__"))
+    return name in {_collection_name(f"s{i}", version) for i in range(num_shards)}
+
+def shard_version(name, metadata=None):
+    """Index version a collection belongs to, None if it isn't a shard.
+    Taken from the metadata index_metadata stores, not parsed from the name."""
+    # the bare name is the pre-sharding collection, still searched if it exists
+    if name != COLLECTION_NAME and not name.startswith(f"{COLLECTION_NAME}_"):
+        return None
+    # collections from before versioning carry no version and belong to index 0
+    return int((metadata or {}).get("version", 0))
+
+def shard_versions(client):
+    """Every shard collection name mapped to its index version"""
+    versions = {}
+    for c in client.list_collections():
+        collection = client.get_collection(c) if isinstance(c, str) else c
+        found = shard_version(collection.name, collection.metadata)
+        if found is not None:
+            versions[collection.name] = found
+    return versions
+
+def rename_shard(name, old_version, version):
+    """Same shard under another index version"""
+    suffix = name[len(_prefix(old_version)):].lstrip("_") or "root"
+    return _collection_name(suffix, version)
+
+def list_shards(client, version=None):
+    return sorted(
+        name for name, found in shard_versions(client).items()
+        if version is None or found == version
+    )
+
+def get_shards(client, refresh=False):
+    """Active index description and its shard collections, cached for
+    SHARD_REFRESH_SECONDS so a finished migration is picked up without a restart"""
+    now = time.monotonic()
+    if refresh or now - _shard_cache["at"] > SHARD_REFRESH_SECONDS:
+        index = load_state()["active"]
+        _shard_cache["collections"] = [
+            client.get_collection(n) for n in list_shards(client, index["version"])
+        ]
+        _shard_cache["index"] = index
+        _shard_cache["at"] = now
+    return _shard_cache["index"], _shard_cache["collections"]
+
+def filter_shards(collections, path_prefix=None, shard_by=SHARD_BY):
+    """With subtree sharding a path prefix only needs its own shard"""
+    if shard_by != "subtree" or not path_prefix:
+        return collections
+
+    head = path_prefix.replace(os.sep, "/").strip("/").split("/")[0]
+    return [
+        c for c in collections
+        if c.name == _collection_name(head, shard_version(c.name, c.metadata))
+    ]
+
+def _query_one(collection, query_embedding, n_results, include, where):
+    n_results = min(n_results, collection.count())
+    if n_results == 0:
+        return None
+    return collection.query(
+        query_embeddings=[query_embedding],
+        n_results=n_results,
+        include=include,
+        where=where,
+    )
+
+def query_shards(collections, query_embedding, n_results, include, where=None):
+    """Query every shard in parallel and merge into one Chroma-shaped result"""
+    include = list(dict.fromkeys([*include, "distances"]))
+    futures = [
+        _query_pool.submit(_query_one, c, query_embedding, n_results, include, where)
+        for c in collections
+    ]
+
+    hits = []
+    failed = 0
+    for future in futures:
+        try:
+            result = future.result()
+        except Exception as e:
+            # usually a shard dropped or swapped by a rebuild; re-list next time
+            debug_log(f"Shard query failed, refreshing shard list: {e}")
+            _shard_cache["at"] = 0.0
+            failed += 1
+            continue
+        if result is None:
+            continue
+        for i, doc_id in enumerate(result["ids"][0]):
+            hit = {"ids": doc_id}
+            for key in include:
+                hit[key] = result[key][0][i]
+            hits.append(hit)
+
+    if futures and failed == len(futures):
+        raise RuntimeError("every shard query failed")
+
+    hits.sort(key=lambda hit: hit["distances"])
+    hits = hits[:n_results]
+
+    merged = {"ids": [[hit["ids"] for hit in hits]]}
+    for key in include:
+        merged[key] = [[hit[key] for hit in hits]]
+    return merged
+
+def get_from_shards(collections, ids, include):
+    """Fetch chunks by id from whichever shards hold them"""
+    futures = [_query_pool.submit(c.get, ids=ids, include=include) for c in collections]
+
+    merged = {"ids": [], **{key: [] for key in include}}
+    for future in futures:
+        result = future.result()
+        merged["ids"] += result["ids"]
+        for key in include:
+            merged[key] += result[key]
+    return merged